@@ -1,3 +1,12 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "numpy==2.2.3",
+# ]
+# ///
+
+import numpy as np
+
 tob_cost = 16700 + 1000
 
 # efi = Exact Flash order, Internal balances
@@ -22,9 +31,12 @@ def fmt(x: float) -> str:
     return f'{multip:7.1%}'
 
 
-for i in (1, 2, 3, 4, 5, 10, 20, 40, 50):
-    efi_amm = efi_var + efi_amm_fixed / i
-    efi_solo = efi_var + efi_solo_fixed / i
-    esln_amm = esln_var + esln_amm_fixed / i
-    esln_solo = esln_var + esln_solo_fixed / i
-    print(f'|{i:2}| {fmt(efi_amm)} | {fmt(efi_solo)} | {fmt(esln_amm)} | {fmt(esln_solo)} |')
+orders = np.array([1, 2, 3, 4, 5, 10, 20, 40, 50])
+
+# One column per scenario, one row per order count.
+var_costs = np.array([efi_var, efi_var, esln_var, esln_var])
+fixed_costs = np.array([efi_amm_fixed, efi_solo_fixed, esln_amm_fixed, esln_solo_fixed])
+costs = var_costs + fixed_costs / orders[:, np.newaxis]
+
+for i, row in zip(orders, costs):
+    print(f'|{i:2}| ' + ' | '.join(fmt(cost) for cost in row) + ' |')
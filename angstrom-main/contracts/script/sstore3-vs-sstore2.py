@@ -1,4 +1,14 @@
-def cost_update_store(pools: int):
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "numpy==2.2.3",
+# ]
+# ///
+
+import numpy as np
+
+
+def cost_update_store(pools: np.ndarray):
     total_bytes = 1 + 32 * pools
     deploy_cost = 32_000 + 200 * total_bytes
 
@@ -6,31 +16,27 @@ def cost_update_store(pools: int):
     return deploy_cost + 5_000 + 800
 
 
-def cost_update_map_naive(pools: int):
+def cost_update_map_naive(pools: np.ndarray):
     return 5_000 * pools
 
 
-def cost_store_read(pools: int):
-    assert pools >= 1
+def cost_store_read(pools: np.ndarray):
+    assert np.all(pools >= 1)
     return 2600 + (pools - 1) * 100
 
 
-def cost_map_read(pools: int):
+def cost_map_read(pools: np.ndarray):
     return 2100 * pools
 
 
-values = sorted(
-    list(
-        set(
-            update_every_h * 60 / (read_every_blocks * 12 / 60)
-            for update_every_h in [1, 4, 8, 12, 24]
-            for read_every_blocks in [1, 5, 12, 300]
-        )
-    )
-)
+values = np.unique([
+    update_every_h * 60 / (read_every_blocks * 12 / 60)
+    for update_every_h in [1, 4, 8, 12, 24]
+    for read_every_blocks in [1, 5, 12, 300]
+])
 
 
-def change_to_map_delta(read_per_update: float, pools: int):
+def change_to_map_delta(read_per_update: np.ndarray, pools: np.ndarray):
     store_cost = cost_update_store(pools)\
         + read_per_update * cost_store_read(pools)
     map_cost = cost_update_map_naive(pools)\
@@ -44,11 +50,11 @@ print('   |' + '|'.join(
     for read_per_update in values
 ) + '|')
 
-for pools in [1, 2, 3, 4, 5, 7, 9, 10, 15, 20]:
-    changes = [
-        change_to_map_delta(read_per_update, pools)
-        for read_per_update in values
-    ]
+all_pools = np.array([1, 2, 3, 4, 5, 7, 9, 10, 15, 20])
+pools_grid, reads_grid = np.meshgrid(all_pools, values, indexing='ij')
+deltas = change_to_map_delta(reads_grid, pools_grid)
+
+for pools, changes in zip(all_pools, deltas):
     s = '|'.join(
         f'{c:^11.2e}'
         for c in changes
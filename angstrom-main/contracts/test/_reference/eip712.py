@@ -2,67 +2,121 @@
 # requires-python = ">=3.12"
 # dependencies = [
 #     "eth-account==0.13.4",
+#     "orjson==3.10.15",
 # ]
 # ///
 
-from typing import Any, Dict, TypeAlias, Callable, Generator
+from typing import Any, Dict, TypeAlias, Callable, Hashable, NamedTuple, TypeVar
 import json
-import argparse
 import os
 import time
 import sys
 import contextlib
-from eth_account._utils.encode_typed_data.encoding_and_hashing import hash_struct
+import socket
 
 
-NestedDirs: TypeAlias = bool | Dict[str, 'NestedDirs']
+def index_out(root: str) -> Dict[str, list[str]]:
+    index: Dict[str, list[str]] = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        # Stored relative to `root` so the index stays valid when `root` is given differently.
+        rel_dir = os.path.relpath(dir_path, root)
+        prefix = '' if rel_dir == os.curdir else rel_dir + os.sep
+        for name in dir_names + file_names:
+            index.setdefault(name, []).append(prefix + name)
+    return index
 
 
-def map_dir(current_path: str) -> Dict[str, 'NestedDirs']:
-    sub_paths = os.listdir(current_path)
-    return {
-        sub_path:
-        True if os.path.isfile(full_sub := os.path.join(current_path, sub_path))
-        else map_dir(full_sub)
-        for sub_path in sub_paths
-    }
+def out_mtime(root: str) -> int:
+    # The index only depends on entry names, which is exactly what directory mtimes track. Artifacts
+    # for duplicate file names get nested arbitrarily deep (`out/<dir>/File.sol/`) so every directory
+    # level is checked. Adding / removing an entry sets its parent's mtime to the current time,
+    # making the latest mtime across all directories change as well.
+    latest = os.stat(root).st_mtime_ns
+    to_visit = [root]
+    while to_visit:
+        with os.scandir(to_visit.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    latest = max(latest, entry.stat(follow_symlinks=False).st_mtime_ns)
+                    to_visit.append(entry.path)
+    return latest
 
 
-def matching_paths(
-    out_dir: Dict[str, 'NestedDirs'],
-    target_file: str,
-    path_so_far: tuple[str, ...] = tuple()
-) -> Generator[str, None, None]:
-    for path_segment, sub_value in out_dir.items():
-        if path_segment == target_file:
-            yield os.path.join(*path_so_far, path_segment)
-        elif isinstance(sub_value, Dict):
-            yield from matching_paths(
-                sub_value,
-                target_file,
-                path_so_far=path_so_far + (path_segment,)
-            )
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'angstrom-eip712')
+
+T = TypeVar('T')
+
+
+def cache_path(kind: str, path: str) -> str:
+    import hashlib
+    digest = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f'{kind}-{digest}.pkl')
+
+
+# In-memory layer in front of the on-disk cache for long-lived (daemon) processes.
+memory_cache: Dict[str, tuple[Hashable, Any]] = {}
+
+
+# Part of every cache key so that edits to this script (e.g. how types are extracted or what is
+# cached) invalidate entries written by a previous version.
+SCRIPT_VERSION = os.stat(__file__).st_mtime_ns
+
+
+def cached(path: str, key: Hashable, compute: Callable[[], T]) -> T:
+    import pickle
+    import tempfile
+
+    key = SCRIPT_VERSION, key
+    if path in memory_cache and memory_cache[path][0] == key:
+        return memory_cache[path][1]
+    try:
+        with open(path, 'rb') as f:
+            cached_key, value = pickle.load(f)
+        if cached_key == key:
+            memory_cache[path] = key, value
+            return value
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+
+    value = compute()
+    memory_cache[path] = key, value
+
+    # Write to a temporary file first so that concurrent invocations never observe a partial cache.
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile('wb', dir=CACHE_DIR, delete=False) as f:
+            pickle.dump((key, value), f)
+        os.replace(f.name, path)
+    except OSError:
+        pass
+
+    return value
 
 
 def path_match(target_path: str, match: str) -> int:
-    for i in range(len(target_path)):
-        if target_path[-i-1:] != match[-i-1:]:
-            return i
-    return len(target_path)
+    # Length of the common suffix. For ASCII paths (bytes == characters) the reversed encodings
+    # are compared 8 bytes at a time before finishing the tail byte by byte.
+    if target_path.isascii() and match.isascii():
+        a = target_path.encode()[::-1]
+        b = match.encode()[::-1]
+        max_len = min(len(a), len(b))
+        i = 0
+        while i + 8 <= max_len and a[i:i + 8] == b[i:i + 8]:
+            i += 8
+        while i < max_len and a[i] == b[i]:
+            i += 1
+        return i
+
+    max_len = min(len(target_path), len(match))
+    i = 0
+    while i < max_len and target_path[-i-1] == match[-i-1]:
+        i += 1
+    return i
 
 
 JsonObject: TypeAlias = Dict[str, 'Json']
 Json: TypeAlias = bool | int | str | list['Json'] | JsonObject
-
-
-def ast_get_all_nodes(ast: JsonObject, criteria: Callable[[JsonObject], bool]) -> Generator[JsonObject, None, None]:
-    if criteria(ast):
-        yield ast
-    nodes = ast.get('nodes', [])
-    assert isinstance(nodes, list)
-    for node in nodes:
-        assert isinstance(node, Dict)
-        yield from ast_get_all_nodes(node, criteria)
+EIP712Types: TypeAlias = Dict[str, list[Dict[str, str]]]
 
 
 def get(obj: Json, *path: str) -> Json:
@@ -86,18 +140,26 @@ def get_list(obj: Json, *path: str) -> list[Json]:
 
 
 def member_to_eip712_field(member: Json) -> Dict[str, str]:
-    name = get_str(member, 'name')
-    node_type = get_str(member, 'typeName', 'nodeType')
+    # Direct subscripts instead of `get_str`, this runs for every member of every converted struct.
+    # Each lookup keeps a single `isinstance` narrowing in place of `get`'s per-step checks.
+    assert isinstance(member, dict), f'Expected object'
+    type_name = member['typeName']
+    assert isinstance(type_name, dict), f'Expected object'
+    node_type = type_name['nodeType']
     if node_type == 'UserDefinedTypeName':
-        field_type = get_str(member, 'typeName', 'pathNode', 'name')
+        path_node = type_name['pathNode']
+        assert isinstance(path_node, dict), f'Expected object'
+        field_type = path_node['name']
     elif node_type == 'ElementaryTypeName':
-        field_type = get_str(member, 'typeName', 'name')
+        field_type = type_name['name']
     else:
         raise ValueError(
             f'Unrecognized member .typeName.nodeType {node_type!r}'
         )
+    name = member['name']
+    assert isinstance(name, str) and isinstance(field_type, str), f'Expected string'
 
-    return {'name': str(name), 'type': str(field_type)}
+    return {'name': name, 'type': field_type}
 
 
 def ast_to_eip712_type(ast: JsonObject) -> tuple[str, list[Dict[str, str]]]:
@@ -129,15 +191,98 @@ def ast_to_eip712_type(ast: JsonObject) -> tuple[str, list[Dict[str, str]]]:
     return name, fields
 
 
+def ast_struct_definitions(ast: JsonObject) -> Dict[str, JsonObject]:
+    # Single iterative pre-order walk, later definitions overwrite earlier ones with the same name.
+    struct_defs: Dict[str, JsonObject] = {}
+    stack: list[JsonObject] = [ast]
+    while stack:
+        node = stack.pop()
+        if node.get('nodeType') == 'StructDefinition':
+            struct_defs[get_str(node, 'name')] = node
+        nodes = node.get('nodes')
+        if nodes:
+            assert isinstance(nodes, list)
+            for sub_node in reversed(nodes):
+                assert isinstance(sub_node, Dict)
+                stack.append(sub_node)
+    return struct_defs
+
+
+def ast_to_eip712_types(ast: JsonObject, struct_name: str) -> EIP712Types:
+    # Only converts the structs reachable from `struct_name`, which is all `encodeType` needs.
+    struct_defs = ast_struct_definitions(ast)
+    types: EIP712Types = {}
+    to_visit = [struct_name]
+    while to_visit:
+        name, fields = ast_to_eip712_type(struct_defs[to_visit.pop()])
+        types[name] = fields
+        for field in fields:
+            field_type = field['type'].split('[', 1)[0]
+            if field_type in struct_defs and field_type not in types:
+                to_visit.append(field_type)
+    return types
+
+
+BOOL_FALSE = frozenset(('false', 'False', '0'))
+BOOL_TRUE = frozenset(('true', 'True', '1'))
+
+
+def parse_bool(value: str) -> bool:
+    if value in BOOL_FALSE:
+        return False
+    elif value in BOOL_TRUE:
+        return True
+    else:
+        raise TypeError(f'Unrecognized boolean value "{value!r}"')
+
+
+# Field types whose values need converting from their CLI string, others are passed through as is.
+FIELD_PARSERS: Dict[str, Callable[[str], Any]] = {
+    'bool': parse_bool,
+}
+
+
 def parse_field_value(value: str, field_type: str) -> Any:
-    if field_type == 'bool':
-        if value in ('false', 'False', '0'):
-            return False
-        elif value in ('true', 'True', '1'):
-            return True
-        else:
-            raise TypeError(f'Unrecognized boolean value "{value!r}"')
-    return value
+    parser = FIELD_PARSERS.get(field_type)
+    return value if parser is None else parser(value)
+
+
+def struct_hash(
+    struct_name: str,
+    types: EIP712Types,
+    type_hash: bytes,
+    data: Dict[str, Any]
+) -> bytes:
+    # Same as `eth_account`'s `hash_struct` but takes the type hash precomputed in `load_struct`.
+    # `eth_account` & co. take hundreds of ms to import so they're only loaded once actually needed,
+    # repeated imports are just a `sys.modules` lookup.
+    from eth_abi.abi import encode
+    from eth_utils.crypto import keccak
+    from eth_account._utils.encode_typed_data.encoding_and_hashing import encode_field
+
+    encoded_types = ['bytes32']
+    encoded_values: list[Any] = [type_hash]
+    for field in types[struct_name]:
+        encoded_type, encoded_value = encode_field(
+            types, field['name'], field['type'], data.get(field['name'])
+        )
+        encoded_types.append(encoded_type)
+        encoded_values.append(encoded_value)
+    return bytes(keccak(encode(encoded_types, encoded_values)))
+
+
+def load_struct(artifact_path: str, struct_name: str) -> tuple[EIP712Types, bytes]:
+    # Returns the types reachable from `struct_name` and its type hash, both are persisted by
+    # `cached` so repeated calls skip `encodeType` + keccak.
+    import orjson
+    from eth_account._utils.encode_typed_data.encoding_and_hashing import hash_type
+
+    with track('load ast'):
+        with open(artifact_path, 'rb') as f:
+            ast = orjson.loads(f.read())['ast']
+    with track('to eip712'):
+        types = ast_to_eip712_types(ast, struct_name)
+    return types, hash_type(struct_name, types)
 
 
 TRACK = False
@@ -154,14 +299,8 @@ def track(name: str):
     print(f'{name}: {delta * 1e3:.2f} ms', file=sys.stderr)
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('path_struct', type=str)
-    parser.add_argument('--out', '-o', type=str, default='out')
-    parser.add_argument('values', nargs='*')
-    args = parser.parse_args()
-
-    struct_path, struct_name = str(args.path_struct).split(':', 1)
+def compute_hash(path_struct: str, out: str, values: list[str]) -> str:
+    struct_path, struct_name = path_struct.split(':', 1)
 
     # if not os.path.isfile(struct_path):
     #     raise ValueError(f'File {struct_path} not found')
@@ -169,13 +308,19 @@ def main():
     # with open(struct_path, 'r') as f:
     #     target_file = f.read()
 
-    with track('map_dir'):
-        out_dir = map_dir(args.out)
+    with track('index_out'):
+        out_index = cached(
+            cache_path('index', out),
+            out_mtime(out),
+            lambda: index_out(out)
+        )
 
     _, path_tail = os.path.split(struct_path)
 
-    possibilities = matching_paths(
-        out_dir, path_tail, path_so_far=(args.out,))
+    possibilities = [
+        os.path.join(out, sub_path)
+        for sub_path in out_index.get(path_tail, ())
+    ]
     artifacts_path = max(
         possibilities,
         key=lambda m: path_match(struct_path, m)
@@ -183,41 +328,186 @@ def main():
     artifact_path = os.listdir(artifacts_path)[0]
     artifact_path = os.path.join(artifacts_path, artifact_path)
 
-    with track('load ast'):
-        with open(artifact_path, 'r') as f:
-            ast = json.load(f)['ast']
-    with track('traverse ast'):
-        struct_defs = ast_get_all_nodes(
-            ast,
-            lambda node: node['nodeType'] == 'StructDefinition'
-        )
-
-    with track('to eip712'):
-        file_types = dict(
-            ast_to_eip712_type(struct_def)
-            for struct_def in struct_defs
+    with track('file_types'):
+        file_types, type_hash = cached(
+            cache_path('struct', f'{artifact_path}:{struct_name}'),
+            os.stat(artifact_path).st_mtime_ns,
+            lambda: load_struct(artifact_path, struct_name)
         )
 
     fields = file_types[struct_name]
 
-    if len(args.values) != len(fields):
+    if len(values) != len(fields):
         raise ValueError(
-            f'Got {len(args.values)} values, expected {len(fields)} in:\n{json.dumps(fields)}'
+            f'Got {len(values)} values, expected {len(fields)} in:\n{json.dumps(fields)}'
         )
 
+    parsed_values = [
+        parse_field_value(value, field['type'])
+        for field, value in zip(fields, values)
+    ]
+
     with track('hash_struct'):
-        hash = hash_struct(
+        hash = struct_hash(
             struct_name,
             file_types,
-            {
-                field['name']: parse_field_value(value, field['type'])
-                for field, value in zip(fields, args.values)
-            }
+            type_hash,
+            {field['name']: value for field, value in zip(fields, parsed_values)}
         )
 
-    print(f'0x{hash.hex()}')
+    return f'0x{hash.hex()}'
+
+
+SOCKET_ENV_VAR = 'ANGSTROM_EIP712_SOCKET'
+
+
+def recv_all(conn: socket.socket) -> bytes:
+    chunks = []
+    while chunk := conn.recv(65536):
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+# Clients that never finish sending their request get disconnected after this many seconds.
+REQUEST_TIMEOUT = 10
+
+
+def handle_request(conn: socket.socket):
+    with conn:
+        try:
+            conn.settimeout(REQUEST_TIMEOUT)
+            request = json.loads(recv_all(conn))
+            response = {'hash': compute_hash(
+                request['path_struct'],
+                os.path.join(request['cwd'], request['out']),
+                request['values']
+            )}
+        except Exception as e:
+            response = {'error': f'{type(e).__name__}: {e}'}
+        with contextlib.suppress(OSError):
+            conn.sendall(json.dumps(response).encode())
+
+
+def serve(socket_path: str):
+    import signal
+    import threading
+
+    # Turn SIGTERM into a regular exit so the socket file below gets cleaned up.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        try:
+            server.listen()
+            print(f'Serving on {socket_path}', file=sys.stderr)
+            # One thread per connection so a slow client doesn't stall parallel ffi calls.
+            while True:
+                conn, _ = server.accept()
+                threading.Thread(target=handle_request, args=(conn,), daemon=True).start()
+        finally:
+            os.unlink(socket_path)
+
+
+def request_daemon(socket_path: str, path_struct: str, out: str, values: list[str]) -> str | None:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(socket_path)
+            conn.sendall(json.dumps({
+                'cwd': os.getcwd(),
+                'path_struct': path_struct,
+                'out': out,
+                'values': values
+            }).encode())
+            conn.shutdown(socket.SHUT_WR)
+            response = json.loads(recv_all(conn))
+    except (OSError, ValueError):
+        # Daemon not running or it closed the connection without a (complete) reply, e.g. because it
+        # was restarted mid-request. Fall back to hashing in-process.
+        return None
+    if 'error' in response:
+        raise ValueError(f'Daemon error: {response["error"]}')
+    return response['hash']
+
+
+class Args(NamedTuple):
+    path_struct: str
+    out: str
+    values: list[str]
+    daemon: bool
+    socket: str | None
+
+
+def parse_args(argv: list[str]) -> Args:
+    # Fast path for the fixed `[--out OUT] path_struct *values` shape used by the Foundry tests,
+    # anything else (flags, `--help`, errors) goes through argparse.
+    out = 'out'
+    rest = argv
+    if len(rest) >= 2 and rest[0] in ('--out', '-o'):
+        out, rest = rest[1], rest[2:]
+    if rest and not any(arg.startswith('-') and not arg[1:2].isdigit() for arg in rest):
+        return Args(rest[0], out, rest[1:], False, os.environ.get(SOCKET_ENV_VAR))
+
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path_struct', type=str, nargs='?')
+    parser.add_argument('--out', '-o', type=str, default='out')
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help='Serve hash requests on a unix socket, reusing loaded types between requests'
+    )
+    parser.add_argument(
+        '--socket',
+        type=str,
+        default=os.environ.get(SOCKET_ENV_VAR),
+        help=f'Unix socket path of the daemon (default: ${SOCKET_ENV_VAR})'
+    )
+    parser.add_argument('values', nargs='*')
+    args = parser.parse_args(argv)
+
+    if args.daemon and args.socket is None:
+        parser.error(f'--daemon requires --socket or ${SOCKET_ENV_VAR}')
+    if not args.daemon and args.path_struct is None:
+        parser.error('the following arguments are required: path_struct')
+
+    return Args(args.path_struct, args.out, args.values, args.daemon, args.socket)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+
+    if args.daemon:
+        assert args.socket is not None
+        serve(args.socket)
+        return
+
+    hash = None
+    if args.socket is not None:
+        hash = request_daemon(args.socket, args.path_struct, args.out, args.values)
+    if hash is None:
+        hash = compute_hash(args.path_struct, args.out, args.values)
+
+    print(hash)
+
+
+PROFILE_ENV_VAR = 'ANGSTROM_PROFILE'
+
+
+def profile_main():
+    # Stats go to stderr, stdout is parsed by the Foundry tests.
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(main)
+    finally:
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(40)
 
 
 if __name__ == '__main__':
     with track('overall'):
-        main()
+        if os.environ.get(PROFILE_ENV_VAR):
+            profile_main()
+        else:
+            main()